@@ -13,17 +13,50 @@
 # limitations under the License.
 
 import asyncio
+import functools
+import hashlib
+import importlib.util
+import itertools
+import json
+import logging
+import re
+import sys
+import time
 import uuid
 import os
+from collections import OrderedDict
+from contextvars import ContextVar
+
+import httpx
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    import numpy as np
+except ImportError:  # the cache falls back to exact matches only
+    np = None
 
 from google.adk.agents import LlmAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
+from google import genai
 from google.genai import types
 
 # --- OpenAPI Tool Imports ---
 from google.adk.tools.openapi_tool.openapi_spec_parser.openapi_toolset import OpenAPIToolset
 
+logger = logging.getLogger(__name__)
+
 # --- Check if API Key is set ---
 if not os.environ.get('GOOGLE_API_KEY'):
     raise ValueError("GOOGLE_API_KEY environment variable is required. Please set it before running the script.")
@@ -35,6 +68,13 @@ USER_ID_OPENAPI = "user_openapi_1"
 SESSION_ID_OPENAPI = f"session_openapi_{uuid.uuid4()}"
 AGENT_NAME_OPENAPI = "petstore_manager_agent"
 GEMINI_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "text-embedding-004"
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_SECONDS = 60 * 60
+CACHE_SIMILARITY_THRESHOLD = 0.92
+SESSION_CAPACITY = 10_000
+HTTP_MAX_CONNECTIONS = 32
+HTTP_KEEPALIVE_SECONDS = 60
 
 # --- Sample OpenAPI Specification (JSON String) ---
 # A basic Pet Store API example using httpbin.org as a mock server
@@ -138,12 +178,51 @@ openapi_spec_string = """
 }
 """
 
+# --- Shared HTTP Pool ---
+# Every client handed to the tools reuses one keep-alive connection pool
+class _SharedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        # The pool outlives each client; see close_http_pool()
+        pass
+
+_HTTP_TRANSPORT = httpx.AsyncHTTPTransport(
+    limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+    ),
+    http2=importlib.util.find_spec("h2") is not None,
+)
+_HTTP_TIMEOUT = httpx.Timeout(connect=10.0, read=600.0, write=600.0, pool=10.0)
+
+def _http_client():
+    return httpx.AsyncClient(transport=_SharedTransport(_HTTP_TRANSPORT), timeout=_HTTP_TIMEOUT)
+
+async def close_http_pool():
+    await _HTTP_TRANSPORT.aclose()
+
 # --- Create OpenAPIToolset ---
+_SPEC = json_loads(openapi_spec_string)
+
 petstore_toolset = OpenAPIToolset(
-    spec_str=openapi_spec_string,
-    spec_str_type='json',
+    spec_dict=_SPEC,
+    httpx_client_factory=_http_client,
 )
 
+# --- Cache Admission ---
+# Names of the toolset's GET tools, filled in by setup_session_and_runner
+_SAFE_OPS = frozenset()
+
+async def _load_safe_ops():
+    tools = await petstore_toolset.get_tools()
+    return frozenset(tool.name for tool in tools if tool.endpoint.method.lower() == "get")
+
 # --- Agent Definition ---
 root_agent = LlmAgent(
     name=AGENT_NAME_OPENAPI,
@@ -160,9 +239,61 @@ root_agent = LlmAgent(
     description="Gerencia uma Pet Store usando ferramentas geradas de uma especificação OpenAPI."
 )
 
+# --- Session Service ---
+# InMemorySessionService that evicts the oldest unpinned session when full
+class RingSessionService(InMemorySessionService):
+    def __init__(self, capacity=SESSION_CAPACITY, pinned=()):
+        super().__init__()
+        self.capacity = capacity
+        self.pinned = frozenset(pinned)
+        # Insertion-ordered: the first key is always the oldest session.
+        self._keys = {}
+
+    async def create_session(self, *, app_name, user_id, state=None, session_id=None):
+        session = await super().create_session(
+            app_name=app_name,
+            user_id=user_id,
+            state=state,
+            session_id=session_id,
+        )
+        if session.id in self.pinned:
+            return session
+        if len(self._keys) >= self.capacity:
+            self._evict(next(iter(self._keys)))
+        self._keys[(app_name, user_id, session.id)] = None
+        return session
+
+    async def delete_session(self, *, app_name, user_id, session_id):
+        await super().delete_session(
+            app_name=app_name,
+            user_id=user_id,
+            session_id=session_id,
+        )
+        self._keys.pop((app_name, user_id, session_id), None)
+
+    def _evict(self, key):
+        app_name, user_id, session_id = key
+        del self._keys[key]
+        self.sessions.get(app_name, {}).get(user_id, {}).pop(session_id, None)
+
 # --- Session and Runner Setup ---
+# One runner per process, published through _RUNNER_CV; _RUNNER is the fallback
+_RUNNER = None
+_RUNNER_CV = ContextVar("runner")
+
+def _current_runner():
+    runner = _RUNNER_CV.get(_RUNNER)
+    if runner is None:
+        raise RuntimeError("No runner available: await setup_session_and_runner() first.")
+    return runner
+
 async def setup_session_and_runner():
-    session_service_openapi = InMemorySessionService()
+    global _RUNNER, _SAFE_OPS
+    if _RUNNER is not None:
+        _RUNNER_CV.set(_RUNNER)
+        return _RUNNER
+
+    session_service_openapi = RingSessionService(pinned={SESSION_ID_OPENAPI})
     runner_openapi = Runner(
         agent=root_agent,
         app_name=APP_NAME_OPENAPI,
@@ -173,49 +304,330 @@ async def setup_session_and_runner():
         user_id=USER_ID_OPENAPI,
         session_id=SESSION_ID_OPENAPI,
     )
+    _SAFE_OPS = await _load_safe_ops()
+    _RUNNER = runner_openapi
+    _RUNNER_CV.set(runner_openapi)
     return runner_openapi
 
+# --- LLM Response Cache ---
+# Exact SHA-256 match first, then embedding similarity; commands bypass it
+_CMD_RE = re.compile(
+    r"\b(cri(?:ar|[ae])|adicion(?:ar|[ae])|delet(?:ar|[ae])|remov(?:er|[ae])|atualiz(?:ar|[ae]))\b",
+    re.IGNORECASE,
+)
+
+# Ids, limits and status values a semantic hit must match exactly
+_STATUS_TOKENS = {
+    word: status
+    for status, words in {
+        "available": ("disponível", "disponíveis", "disponivel", "disponiveis"),
+        "pending": ("pendente", "pendentes"),
+        "sold": ("vendido", "vendidos", "vendida", "vendidas"),
+    }.items()
+    for word in (status, *words)
+}
+
+def _query_params(query):
+    tokens = re.findall(r"\w+", query.lower())
+    return (
+        tuple(token for token in tokens if token.isdigit()),
+        frozenset(_STATUS_TOKENS[token] for token in tokens if token in _STATUS_TOKENS),
+    )
+
+class LLMCache:
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS,
+                 threshold=CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        # key -> (expires_at, session_id, response, vector, params)
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._matrix_sessions = None
+        self._matrix_params = []
+        self._vector_sessions = set()
+
+    @staticmethod
+    def key(query, session_id):
+        payload = json.dumps({"q": query.lower().strip(), "session": session_id})
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            self._matrix = None
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def get_similar(self, session_id, vector, params):
+        if np is None or vector is None:
+            return None
+        if self._matrix is None:
+            self._rebuild_matrix()
+        if not self._matrix_keys:
+            return None
+        scores = self._matrix @ vector
+        scores[self._matrix_sessions != session_id] = -1.0
+        scores[np.array([p != params for p in self._matrix_params])] = -1.0
+        best = int(scores.argmax())
+        if scores[best] < self.threshold:
+            return None
+        return self.get(self._matrix_keys[best])
+
+    def set(self, key, response, session_id, vector=None, params=None):
+        self._entries[key] = (time.monotonic() + self.ttl, session_id, response, vector, params)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def has_vectors(self, session_id):
+        if np is None:
+            return False
+        if self._matrix is None:
+            self._rebuild_matrix()
+        return session_id in self._vector_sessions
+
+    def invalidate(self, session_id):
+        stale = [key for key, entry in self._entries.items() if entry[1] == session_id]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self._matrix = None
+
+    def _rebuild_matrix(self):
+        now = time.monotonic()
+        rows = [
+            (key, entry) for key, entry in self._entries.items()
+            if entry[3] is not None and entry[0] >= now
+        ]
+        self._vector_sessions = {entry[1] for _, entry in rows}
+        self._matrix_keys = [key for key, _ in rows]
+        self._matrix_params = [entry[4] for _, entry in rows]
+        if rows:
+            self._matrix = np.stack([entry[3] for _, entry in rows])
+            self._matrix_sessions = np.array([entry[1] for _, entry in rows], dtype=object)
+        else:
+            self._matrix = np.empty((0, 0))
+            self._matrix_sessions = np.empty(0, dtype=object)
+
+llm_cache = LLMCache()
+_RUN_CONFIG = RunConfig(streaming_mode=StreamingMode.SSE)
+_genai_client = genai.Client()
+
+def _is_command(query):
+    return _CMD_RE.search(query) is not None
+
+async def _embed(query):
+    if np is None:
+        return None
+    try:
+        result = await _genai_client.aio.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=query,
+        )
+        vector = np.asarray(result.embeddings[0].values, dtype=np.float32)
+    except Exception as e:
+        logger.warning("Embedding failed, skipping the semantic cache tier: %s", e)
+        return None
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
 # --- Agent Interaction Function ---
-async def call_agent(query, runner_openapi):
-    content = types.Content(role='user', parts=[types.Part(text=query)])
-    final_response_text = "Agent não forneceu uma resposta final."
+@functools.lru_cache(maxsize=1024)
+def _user_content(query):
+    return types.Content(role='user', parts=[types.Part(text=query)])
+
+# Cache hits skip run_async, so record the turn in the session history
+async def _record_cached_turn(session_id, content, response):
+    session_service = _current_runner().session_service
+    session = await session_service.get_session(
+        app_name=APP_NAME_OPENAPI,
+        user_id=USER_ID_OPENAPI,
+        session_id=session_id,
+    )
+    if session is None:
+        return
+    invocation_id = Event.new_id()
+    await session_service.append_event(
+        session, Event(invocation_id=invocation_id, author='user', content=content)
+    )
+    await session_service.append_event(
+        session,
+        Event(
+            invocation_id=invocation_id,
+            author=AGENT_NAME_OPENAPI,
+            content=types.Content(role='model', parts=[types.Part(text=response)]),
+        ),
+    )
+
+# Yields text chunks as they stream; the aggregated SSE event is not repeated
+async def call_agent(query, session_id=SESSION_ID_OPENAPI, on_tool_calls=None, use_cache=True):
+    runner = _current_runner()
+    cacheable = use_cache and not _is_command(query)
+    vector = None
+    embedding = None
+    if cacheable:
+        cache_key = llm_cache.key(query, session_id)
+        params = _query_params(query)
+        cached = llm_cache.get(cache_key)
+        if cached is None and llm_cache.has_vectors(session_id):
+            vector = await _embed(query)
+            cached = llm_cache.get_similar(session_id, vector, params)
+        if cached is not None:
+            await _record_cached_turn(session_id, _user_content(query), cached)
+            yield cached
+            return
+        if vector is None and np is not None:
+            # Nothing to compare against yet: embed alongside the agent turn.
+            embedding = asyncio.create_task(_embed(query))
+    elif use_cache:
+        llm_cache.invalidate(session_id)
+
+    content = _user_content(query)
+    final_response_text = None
+    streamed = False
+    safe_call_seen = False
     
     try:
-        async for event in runner_openapi.run_async(
+        async for event in runner.run_async(
             user_id=USER_ID_OPENAPI, 
-            session_id=SESSION_ID_OPENAPI, 
-            new_message=content
+            session_id=session_id, 
+            new_message=content,
+            run_config=_RUN_CONFIG,
         ):
-            if event.get_function_calls():
-                call = event.get_function_calls()[0]
-                print(f"🔧 Executando: {call.name}")
-            elif event.is_final_response() and event.content and event.content.parts:
-                final_response_text = event.content.parts[0].text.strip()
-        
-        return final_response_text
+            calls = event.get_function_calls()
+            if calls:
+                if any(call.name not in _SAFE_OPS for call in calls):
+                    cacheable = False
+                    llm_cache.invalidate(session_id)
+                else:
+                    safe_call_seen = True
+                # ADK runs parallel calls of one event concurrently
+                if on_tool_calls is not None and not event.partial:
+                    on_tool_calls(calls)
+            elif event.content and event.content.parts and event.content.parts[0].text:
+                text = event.content.parts[0].text
+                if event.partial:
+                    streamed = True
+                    yield text
+                    continue
+                if not streamed:
+                    yield text
+                streamed = False
+                if event.is_final_response():
+                    final_response_text = text
+
+        # Only store answers backed by at least one safe API call
+        if cacheable and safe_call_seen and final_response_text is not None:
+            if embedding is not None:
+                vector = await embedding
+            llm_cache.set(cache_key, final_response_text.strip(), session_id, vector, params)
     except Exception as e:
-        return f"Erro: {str(e)}"
+        yield f"Erro: {str(e)}"
+        return
+    finally:
+        if embedding is not None:
+            embedding.cancel()
+        
+    if final_response_text is None:
+        yield "Agent não forneceu uma resposta final."
+
+# --- Batch Mode ---
+# Concurrent queries, one short-lived session each
+# Session ids only need to be unique within the process
+_SESSION_COUNTER = itertools.count()
+
+def _new_session_id():
+    return f"session_openapi_{next(_SESSION_COUNTER)}_{os.getpid()}"
+
+async def call_agent_batch(queries, concurrency=8):
+    session_service = _current_runner().session_service
+    # Never run more sessions at once than the service can hold.
+    concurrency = min(concurrency, getattr(session_service, "capacity", concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _guarded(query):
+        async with semaphore:
+            session_id = _new_session_id()
+            await session_service.create_session(
+                app_name=APP_NAME_OPENAPI,
+                user_id=USER_ID_OPENAPI,
+                session_id=session_id,
+            )
+            try:
+                chunks = [chunk async for chunk in call_agent(query, session_id, use_cache=False)]
+                return "".join(chunks).strip()
+            finally:
+                await session_service.delete_session(
+                    app_name=APP_NAME_OPENAPI,
+                    user_id=USER_ID_OPENAPI,
+                    session_id=session_id,
+                )
+
+    results = await asyncio.gather(
+        *(_guarded(query) for query in queries),
+        return_exceptions=True,
+    )
+    return [f"Erro: {result}" if isinstance(result, Exception) else result for result in results]
+
+# --- Async Input ---
+# Reads stdin without blocking the loop (add_reader on POSIX ttys)
+async def read_input(prompt):
+    if sys.platform == "win32" or not sys.stdin.isatty():
+        return await asyncio.to_thread(input, prompt)
+
+    print(prompt, end="", flush=True)
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    fd = sys.stdin.fileno()
+    loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_reader(fd)
+
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError
+    return line.rstrip("\n")
 
 # --- Interactive Terminal ---
+_EXIT_COMMANDS = frozenset(("sair", "quit", "exit", "q"))
+_BANNER = "\n".join([
+    "🐕 ===== TERMINAL INTERATIVO - PET STORE AGENT =====",
+    "📋 Comandos disponíveis:",
+    "   - Listar pets: 'mostre os pets', 'quais pets estão disponíveis'",
+    "   - Criar pet: 'crie um gato chamado Mimi', 'adicione um cão Rex'",
+    "   - Buscar pet: 'mostre o pet 123', 'info do pet 456'",
+    "   - Sair: 'sair', 'quit', 'exit'",
+    "=" * 60,
+])
+_READY_MESSAGE = "\n".join([
+    "✅ Sistema inicializado com sucesso!",
+    "💬 Digite sua mensagem (ou 'sair' para terminar):",
+])
+
+def _print_tool_calls(calls):
+    print(f"🔧 Executando: {', '.join(call.name for call in calls)}")
+
 async def interactive_terminal():
-    print("🐕 ===== TERMINAL INTERATIVO - PET STORE AGENT =====")
-    print("📋 Comandos disponíveis:")
-    print("   - Listar pets: 'mostre os pets', 'quais pets estão disponíveis'")
-    print("   - Criar pet: 'crie um gato chamado Mimi', 'adicione um cão Rex'")
-    print("   - Buscar pet: 'mostre o pet 123', 'info do pet 456'")
-    print("   - Sair: 'sair', 'quit', 'exit'")
-    print("=" * 60)
+    print(_BANNER)
     
     try:
-        runner = await setup_session_and_runner()
-        print("✅ Sistema inicializado com sucesso!")
-        print("💬 Digite sua mensagem (ou 'sair' para terminar):")
+        await setup_session_and_runner()
+        print(_READY_MESSAGE)
         
         while True:
             try:
-                user_input = input("\n🗣️  Você: ").strip()
+                user_input = (await read_input("\n🗣️  Você: ")).strip()
                 
-                if user_input.lower() in ['sair', 'quit', 'exit', 'q']:
+                if len(user_input) <= 4 and user_input.lower() in _EXIT_COMMANDS:
                     print("👋 Tchau! Até logo!")
                     break
                 
@@ -224,22 +636,51 @@ async def interactive_terminal():
                     continue
                 
                 print("🤖 Agente: Processando...", end="", flush=True)
-                response = await call_agent(user_input, runner)
-                print(f"\r🤖 Agente: {response}")
+                first_chunk = True
+                async for chunk in call_agent(user_input, on_tool_calls=_print_tool_calls):
+                    if first_chunk:
+                        sys.stdout.write("\r🤖 Agente: ")
+                        chunk = chunk.lstrip()
+                        first_chunk = False
+                    sys.stdout.write(chunk)
+                    sys.stdout.flush()
+                print()
                 
             except KeyboardInterrupt:
                 print("\n👋 Interrompido pelo usuário. Tchau!")
                 break
+            except EOFError:
+                print("\n👋 Tchau! Até logo!")
+                break
             except Exception as e:
                 print(f"\n❌ Erro: {e}")
                 
     except Exception as e:
         print(f"❌ Erro ao inicializar o sistema: {e}")
 
+# --- Entry Point ---
+# Shared clients are closed here, once, because call_agent may run again
+async def _main():
+    try:
+        await interactive_terminal()
+    finally:
+        await close_http_pool()
+        await _genai_client.aio.aclose()
+
+# --- Event Loop ---
+def run(main):
+    if uvloop is None:
+        return asyncio.run(main)
+    if hasattr(asyncio, "Runner"):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(main)
+    uvloop.install()
+    return asyncio.run(main)
+
 # --- Execute ---
 if __name__ == "__main__":
     try:
-        asyncio.run(interactive_terminal())
+        run(_main())
     except KeyboardInterrupt:
         print("\n👋 Programa encerrado.")
     except Exception as e: